@@ -97,6 +97,7 @@ class NumpyBackend(Backend):
     var = staticmethod(np.var)
     power = staticmethod(np.power)
     matmul = staticmethod(np.matmul)
+    einsum = staticmethod(np.einsum)
     tan = staticmethod(np.tan)
 
     # Dot product between a scipy sparse matrix and a numpy array.
@@ -175,6 +176,7 @@ if AG_AVAILABLE:
         var = staticmethod(npa.var)
         power = staticmethod(npa.power)
         matmul = staticmethod(npa.matmul)
+        einsum = staticmethod(npa.einsum)
         tan = staticmethod(npa.tan)
 
         # Dot product between a scipy sparse matrix and a numpy array.
@@ -427,10 +427,13 @@ class ExcitonSchroedEq(object):
         kind : int
             The wavefunction of the mode at `ExcitonSchroedEq.kpoints[:, kind]` is 
             computed.
-        mind : int
+        mind : int or slice
             The wavefunction of the `mind` mode at that kpoint is computed.
+            If `mind` is a slice (or an array of indices), the wavefunctions
+            of all the selected modes are computed at once.
         ft: np.ndarray
-            The Fourier transform of specified wavefunction.
+            The Fourier transform of specified wavefunction, with shape
+            (Ng, ) for a single mode or (Ng, Nmodes) for several modes.
         """
         evec = self.eigvecs[kind][:, mind]
         ft = evec
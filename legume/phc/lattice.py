@@ -2,6 +2,9 @@ import numpy as np
 from legume.backend import backend as bd
 import legume.utils as utils
 
+# sqrt(3)/2, used for the hexagonal lattice vectors
+_SQRT3_2 = 0.8660254037844386
+
 
 class Lattice(object):
     """
@@ -53,15 +56,17 @@ class Lattice(object):
                 a2 = bd.array([0, 1, 0])
             elif args[0] == 'hexagonal':
                 self.type = 'hexagonal'
-                a1 = bd.array([0.5, bd.sqrt(3) / 2, 0])
-                a2 = bd.array([0.5, -bd.sqrt(3) / 2, 0])
+                a1 = bd.array([0.5, _SQRT3_2, 0.0])
+                a2 = bd.array([0.5, -_SQRT3_2, 0.0])
             else:
                 raise ValueError("Lattice can be 'square' or 'hexagonal, "
                                  "or defined through two primitive vectors.")
 
         elif len(args) == 2:
-            a1 = bd.hstack((bd.array(args[0]), 0))
-            a2 = bd.hstack((bd.array(args[1]), 0))
+            if len(args[0]) != 2 or len(args[1]) != 2:
+                raise ValueError("Primitive vectors must be 2-element arrays.")
+            a1 = bd.array([args[0][0], args[0][1], 0.0])
+            a2 = bd.array([args[1][0], args[1][1], 0.0])
             if np.inner(a1, a2) == 0:
                 self.type = 'rectangular'
             else:
@@ -143,27 +148,28 @@ class Lattice(object):
         else:
             raise ValueError("Length of ns must be either 1 or len(pts) - 1")
 
-        kpoints = np.zeros((2, np.sum(ns) + 1))
-        inds = [0]
-        count = 0
-
-        for ip in range(npts - 1):
-            p1 = self._parse_point(pts[ip])
-            p2 = self._parse_point(pts[ip + 1])
-            kpoints[:, count:count+ns[ip]] = p1[:, np.newaxis] + np.outer(\
-                        (p2 - p1), np.linspace(0, 1, ns[ip], endpoint=False))
-            count = count + ns[ip]
-            inds.append(count)
-        kpoints[:, -1] = p2
+        # Column-major, so that every k-point kpoints[:, ik] is contiguous
+        kpoints = np.empty((2, np.sum(ns) + 1), order='F')
+        inds = [0] + list(np.cumsum(ns))
+
+        # Parse each point once, then get the segment index and fractional
+        # position along it for every k-point
+        parsed = [self._parse_point(pt) for pt in pts]
+        pts_arr = np.stack(parsed, axis=1)
+        seg_ids = np.repeat(np.arange(npts - 1), ns)
+        t = np.concatenate(
+            [np.linspace(0, 1, n, endpoint=False) for n in ns])
+        kpoints[:, :-1] = pts_arr[:, seg_ids] + (pts_arr[:, seg_ids + 1] -
+                                                 pts_arr[:, seg_ids]) * t
+        kpoints[:, -1] = pts_arr[:, -1]
 
         # Angles of wavevectors in (kx,ky) plane
         angs = np.angle(kpoints[0] + 1j * kpoints[1], deg=True)
         #If gamma point is present, force symmetry from 'symm_g'
         index_g = np.where((kpoints[0] == 0) & (kpoints[1] == 0))
         if len(index_g) != 0:
-            ang_g = np.angle(self._parse_point(symm_g)[0] +
-                             1j * self._parse_point(symm_g)[1],
-                             deg=True)
+            p_g = self._parse_point(symm_g)
+            ang_g = np.angle(p_g[0] + 1j * p_g[1], deg=True)
             angs[index_g] = ang_g
 
         angs = tuple(angs)
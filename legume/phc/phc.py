@@ -32,6 +32,9 @@ class PhotCryst(object):
 
         # Initialize an empty list of layers
         self.layers = []
+        # Sorted upper boundaries of the lower cladding and of the layers,
+        # used by utils.z_to_lind to find the layer a z position lies in
+        self.layers_z_max = [utils.get_value(self.claddings[0].z_max)]
         # Initialize an empty list of quantum wells
         self.qws = []
 
@@ -86,6 +89,7 @@ class PhotCryst(object):
 
         self.claddings[1].z_min = z_min + d
         self.layers.append(layer)
+        self.layers_z_max.append(utils.get_value(layer.z_max))
 
     def add_qw(self, z: float, V_shapes: float, a: float, M: float, E0: float,
                loss: float, osc_str):
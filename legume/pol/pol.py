@@ -1,4 +1,7 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from scipy.linalg import eig as sp_eig
 from legume.utils import ftinv, z_to_lind, from_freq_to_e
 from legume.print_utils import verbose_print
 from legume.print_backend import print_backend as prbd
@@ -29,6 +32,8 @@ class HopfieldPol(object):
         self.gme = GuidedModeExp(phc, gmax, truncate_g=truncate_g)
 
         self.exc_list = []
+        # Contraction paths of the einsum computing the C blocks
+        self._C_einsum_paths = {}
 
         if len(phc.qws) == 0:
             raise ValueError(
@@ -134,25 +139,29 @@ class HopfieldPol(object):
     def _calculate_fraction(self, eigenvectors):
         """
         Calculate the photonic and excitonic fraction of the bands starting from
-        the polaritonic eigenvectors.
+        the polaritonic eigenvectors, stored in the columns of the last two
+        axes of `eigenvectors` (leading axes, e.g. k-points, are kept).
 
          """
 
-        # Not pythonic, could be done better
-        num_bands = bd.shape(eigenvectors)[1]
-        frac_ex = bd.zeros((num_bands))
-        frac_ph = bd.zeros((num_bands))
+        N, M, Q = self.N_max, self.M_max, self.num_QWs
 
-        for band in range(num_bands):
-            frac_ph[band] = bd.sum(bd.abs(eigenvectors[0:self.N_max,band])**2)\
-            +bd.sum(bd.abs(eigenvectors[self.N_max+self.M_max*self.num_QWs:2*self.N_max+self.M_max*self.num_QWs,band])**2)
+        def weight(rows):
+            # sum of |v|^2 = Re^2 + Im^2 over rows, fused by einsum without
+            # allocating the squared eigenvectors
+            v_re = bd.real(eigenvectors[..., rows, :])
+            v_im = bd.imag(eigenvectors[..., rows, :])
+            return (bd.einsum('...ib,...ib->...b', v_re, v_re) +
+                    bd.einsum('...ib,...ib->...b', v_im, v_im))
 
-            frac_ex[band] = bd.sum(bd.abs(eigenvectors[self.N_max:self.N_max+self.M_max*self.num_QWs,band])**2)\
-            +bd.sum(bd.abs(eigenvectors[2*self.N_max+self.M_max*self.num_QWs:,band])**2)
+        frac_ph = weight(slice(0, N)) + weight(
+            slice(N + M * Q, 2 * N + M * Q))
+        frac_ex = weight(slice(N, N + M * Q)) + weight(
+            slice(2 * N + M * Q, None))
 
         return frac_ex, frac_ph
 
-    def _calculate_C_D(self, exc, kind):
+    def _calculate_C_D(self, exc, kind, C_out=None, E_ft_cache=None):
         """C and D blocks of generalized Hopfield matrix,
         see Appendix of https://journals.aps.org/prb/abstract/10.1103/PhysRevB.75.235325,
         here we adopt SI units by adding the factor 1/(4*pi*epsilon_0). The factor 1/sqrt(a)
@@ -165,27 +174,49 @@ class HopfieldPol(object):
 
         The Oscillator strength must be converted to 'float'.
 
+        If `C_out` is given, the C block is written in place into it.
+        `E_ft_cache` is a dictionary used to share the electric field Fourier
+        components between excitonic layers at the same z.
+
          """
         pref = -1j * bd.sqrt(cs.hbar**2 * cs.e**2 /
                              (4 * cs.m_e * cs.epsilon_0)) / cs.e / bd.sqrt(
                                  self.a)
-        C = bd.zeros((self.N_max, self.M_max), dtype="complex")
-        #n: loop over photonic modes, nu: loop over excitonic modes
-        for n in range(self.N_max):
-            E_comp = self.gme.ft_field_xy("E", kind=kind, mind=n, z=exc.z)
-            for nu in range(self.M_max):
-                W_comp = exc.ft_wavef_xy(kind=kind, mind=nu)
-                C[n, nu] = pref * bd.sum(
-                    bd.dot(bd.sqrt(exc.osc_str.astype(float)), E_comp) *
-                    bd.conj(W_comp))
-
-        D = bd.zeros((self.N_max, self.N_max), dtype="complex")
-        #n_1, n_2 loop over photonic modes (n and n' in the paper), nu loop over excitonic modes
-        for n_1 in range(self.N_max):
-            for n_2 in range(self.N_max):
-                D[n_1, n_2] = bd.sum(
-                    bd.conj(C[n_1, :]) * C[n_2, :] /
-                    bd.real(exc.eners[kind, :]))
+        osc_sqrt = bd.sqrt(exc.osc_str.astype(float))
+        #Fourier components of the electric field (n, component, g) of the
+        #photonic modes and of the excitonic wavefunctions (nu, g)
+        #excitons sitting at the same z share the same field components
+        if E_ft_cache is None: E_ft_cache = {}
+        z_key = (kind, round(exc.z, 12))
+        if z_key not in E_ft_cache:
+            E_ft_cache[z_key] = bd.stack([
+                bd.stack(
+                    self.gme.ft_field_xy("E", kind=kind, mind=n, z=exc.z))
+                for n in range(self.N_max)
+            ])
+        E_comp = E_ft_cache[z_key]
+        W_comp = exc.ft_wavef_xy(kind=kind, mind=slice(0, self.M_max)).T
+        W_conj = bd.conj(W_comp)
+        #n: photonic modes, nu: excitonic modes. The optimal contraction
+        #order is computed once for each set of operand shapes
+        path_key = (E_comp.shape, W_conj.shape)
+        if path_key not in self._C_einsum_paths:
+            self._C_einsum_paths[path_key] = np.einsum_path(
+                'c,ncg,ug->nu', osc_sqrt, E_comp, W_conj,
+                optimize='optimal')[0]
+        C = bd.einsum('c,ncg,ug->nu',
+                      osc_sqrt,
+                      E_comp,
+                      W_conj,
+                      optimize=self._C_einsum_paths[path_key],
+                      out=C_out,
+                      casting='same_kind')
+        C *= pref
+
+        #D[n_1, n_2] = sum_nu conj(C[n_1, nu]) * C[n_2, nu] / Re(E_nu),
+        #symmetrized to remove the rounding differences from exact Hermiticity
+        D = bd.matmul(bd.conj(C), (C / bd.real(exc.eners[kind, :])).T)
+        D = 0.5 * (D + bd.conj(D.T))
 
         return C, D
 
@@ -194,56 +225,92 @@ class HopfieldPol(object):
 
         """
 
-        # Conversion factor: from dimensionless frequency to eV
-        conv_fact = from_freq_to_e(self.a)
+        #Cache of the electric field Fourier components, indexed by (kind, z)
+        E_ft_cache = {}
 
-        #Initialise the list which contains all the C blocks, and the final D block
-        C_blocks = [[] for i in range(self.num_QWs)]
+        #Initialise the C blocks of all QWs, and the final D block
+        C_final_block = np.empty((self.N_max, self.M_max * self.num_QWs),
+                                 dtype=self._dtype)
         D_final_block = bd.zeros((self.N_max, self.N_max), dtype="complex")
 
-        #Calculate the photonic diagonal block
-        diag_phot = bd.zeros((self.N_max, self.N_max), dtype="complex")
-
-        np.fill_diagonal(
-            diag_phot, self.gme.freqs[kind, :] * conv_fact +
-            1j * self.gme.freqs_im[kind, :] * conv_fact)
-
         for ind_ex, exc_sch in enumerate(self.exc_list):
-            C, D = self._calculate_C_D(exc=exc_sch, kind=kind)
+            C_view = C_final_block[:, ind_ex * self.M_max:(ind_ex + 1) *
+                                   self.M_max]
+            _, D = self._calculate_C_D(exc=exc_sch,
+                                       kind=kind,
+                                       C_out=C_view,
+                                       E_ft_cache=E_ft_cache)
             D_final_block = D_final_block + D
-            C_blocks[ind_ex] = C
 
-        C_final_block = bd.hstack([c for c in C_blocks])
-        C_dagger_final_block = bd.conj(C_final_block.T)
+        C_dagger_final_block = C_final_block.conj().T
+
+        #Diagonal of the excitonic block
+        exc_el = self._exc_diag[kind, :]
 
-        #Initialise the excitonic block
-        diag_exc = bd.zeros(
-            (self.M_max * self.num_QWs, self.M_max * self.num_QWs),
-            dtype="complex")
-        exc_el = bd.concatenate(
-            [exc_out.eners[kind] for exc_out in self.exc_list])
+        #Photonic block: dense 2*Re(D) plus the photonic energies on the
+        #diagonal
+        D_re2 = 2 * bd.real(D_final_block)
+        phot_el = self._phot_diag[kind, :] + np.diagonal(D_re2)
 
-        np.fill_diagonal(diag_exc, exc_el)
+        #Write the blocks directly into the preallocated Hopfield matrix,
+        #rows/columns are ordered as [phot, exc, phot, exc]
+        N, B = self.N_max, self.N_max + self.M_max * self.num_QWs
+        ph0, ex0 = slice(0, N), slice(N, B)
+        ph1, ex1 = slice(B, B + N), slice(B + N, 2 * B)
+        M = np.empty((2 * B, 2 * B), dtype=self._dtype, order='F')
 
-        diag_phot = diag_phot + 2 * bd.real(D_final_block)
+        M[ph0, ph0] = D_re2
+        np.fill_diagonal(M[ph0, ph0], phot_el)
+        np.negative(D_re2, out=M[ph1, ph1])
+        np.fill_diagonal(M[ph1, ph1], -phot_el)
+        M[ex0, ex0] = 0
+        np.fill_diagonal(M[ex0, ex0], exc_el)
+        M[ex1, ex1] = 0
+        np.fill_diagonal(M[ex1, ex1], -exc_el)
 
-        row_0 = bd.hstack(
-            (diag_phot, -1j * C_final_block, -2 * D, -1j * C_final_block))
-        row_1 = bd.hstack((1j * C_dagger_final_block, diag_exc,
-                           -1j * C_dagger_final_block, diag_exc * 0.))
-        row_2 = bd.hstack(
-            (2 * D, -1j * C_final_block, -diag_phot, -1j * C_final_block))
-        row_3 = bd.hstack((-1j * C_dagger_final_block, diag_exc * 0.,
-                           1j * C_dagger_final_block, -diag_exc))
-        M = bd.vstack((row_0, row_1, row_2, row_3))
+        np.multiply(D, -2, out=M[ph0, ph1])
+        np.multiply(D, 2, out=M[ph1, ph0])
+
+        np.multiply(C_final_block, -1j, out=M[ph0, ex0])
+        M[ph0, ex1] = M[ph0, ex0]
+        M[ph1, ex0] = M[ph0, ex0]
+        M[ph1, ex1] = M[ph0, ex0]
+
+        np.multiply(C_dagger_final_block, 1j, out=M[ex0, ph0])
+        M[ex1, ph1] = M[ex0, ph0]
+        np.negative(M[ex0, ph0], out=M[ex0, ph1])
+        M[ex1, ph0] = M[ex0, ph1]
+
+        M[ex0, ex1] = 0
+        M[ex1, ex0] = 0
 
         return M
 
+    def _solve_one_k(self, kind):
+        """ Construct and diagonalize the Hopfield matrix at the k-point
+        `kind`. The eigenvalues are shifted by 1, see :meth:`HopfieldPol.run`.
+
+        """
+        # Construct the Hopfield matrix for diagonalization in eV
+        mat = self._construct_Hopfield(kind=kind)
+        if kind == self.kpoints.shape[1] - 1:
+            self.mat = mat.copy()
+
+        # NB: we shift the matrix by np.eye to avoid problems at the zero-
+        # frequency mode at Gamma. The shift is done in place and the
+        # (Fortran-ordered) matrix is overwritten by LAPACK.
+        mat[np.diag_indices(self.numeig)] += 1
+        (ener2, evecs) = sp_eig(mat, overwrite_a=True, check_finite=False)
+
+        return ener2, evecs
+
     def run(self,
             gme_options={},
             exc_options={},
             kpoints: np.ndarray = np.array([[0], [0]]),
-            verbose=True):
+            verbose=True,
+            dtype=np.complex128,
+            n_jobs=1):
         """
         Compute the eigenmodes of the photonic crystal taking
         into account light-matter interaction.
@@ -276,7 +343,28 @@ class HopfieldPol(object):
         kpoints : np.ndarray, optional
             Numpy array of shape (2, Nk) with the [kx, ky] coordinates of the 
             k-vectors over which the simulation is run.
+        verbose : bool, optional
+            Print information about the computation.
+        dtype : {np.complex128, np.complex64}, optional
+            Precision in which the Hopfield matrix is assembled and
+            diagonalized. ``np.complex64`` halves the memory traffic and
+            speeds up the diagonalization, at the cost of single-precision
+            energies and fractions; check it against a ``np.complex128`` run
+            before relying on it.
+        n_jobs : int, optional
+            Number of threads over which the k-points are distributed. The
+            diagonalization releases the GIL, so k-points are solved
+            concurrently. ``-1`` uses one thread per CPU; since each thread
+            calls a possibly multithreaded LAPACK, this oversubscribes the
+            CPU unless the BLAS/LAPACK threads are limited (e.g. with
+            ``OMP_NUM_THREADS=1``).
         """
+        if np.dtype(dtype) not in (np.complex64, np.complex128):
+            raise ValueError("'dtype' can be np.complex64 or np.complex128.")
+        if not (isinstance(n_jobs, (int, np.integer)) and
+                (n_jobs > 0 or n_jobs == -1)):
+            raise ValueError("'n_jobs' must be a positive integer or -1.")
+
         eners = []
         eners_im = []
         self._kpoints = kpoints
@@ -285,6 +373,7 @@ class HopfieldPol(object):
         self._fractions_ph = []
         self.verbose = verbose
         self._gvec = self.gme.gvec
+        self._dtype = np.dtype(dtype)
 
         #Force the same kpoints for gme and exc solvers
         gme_options['kpoints'] = self.kpoints
@@ -305,22 +394,40 @@ class HopfieldPol(object):
         self.M_max = self.exc_list[0].numeig_ex
         num_k = kpoints.shape[1]  # Number of wavevectors
 
-        for ik, k in enumerate(self.kpoints.T):
-            prbd.update_prog(ik, num_k, self.verbose, "Running HP k-points:")
-
-            # Construct the Hopfield matrix for diagonalization in eV
-            mat = self._construct_Hopfield(kind=ik)
-            self.numeig = np.shape(mat)[0]
-
-            # NB: we shift the matrix by np.eye to avoid problems at the zero-
-            # frequency mode at Gamma
-            (ener2, evecs) = bd.eig(mat + bd.eye(mat.shape[0]))
-            ener1 = ener2 - bd.ones(mat.shape[0])
+        # Diagonals of the photonic (converted from dimensionless frequency
+        # to eV) and excitonic blocks at all k-points
+        conv_fact = from_freq_to_e(self.a)
+        self._phot_diag = (self.gme.freqs +
+                           1j * self.gme.freqs_im) * conv_fact
+        self._exc_diag = bd.concatenate(
+            [exc_out.eners for exc_out in self.exc_list], axis=1)
+
+        self.numeig = 2 * (self.N_max + self.M_max * self.num_QWs)
+        if n_jobs == -1: n_jobs = os.cpu_count()
+
+        ener2_all = []
+        evecs_all = []
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            for ik, (ener2, evecs) in enumerate(
+                    executor.map(self._solve_one_k, range(num_k))):
+                prbd.update_prog(ik, num_k, self.verbose,
+                                 "Running HP k-points:")
+                ener2_all.append(ener2)
+                evecs_all.append(evecs)
+
+        ener1_all = bd.stack(ener2_all) - bd.ones(self.numeig)
+        evecs_all = bd.stack(evecs_all)
+        fractions_ex_all, fractions_ph_all = self._calculate_fraction(
+            evecs_all)
+
+        for ik in range(num_k):
+            ener1 = ener1_all[ik]
             #Filter positive energies
             filt_pos = bd.real(ener1) >= 0
             ener1 = ener1[filt_pos]
-            evecs = evecs[:, filt_pos]
-            fractions_ex, fractions_ph = self._calculate_fraction(evecs)
+            evecs = evecs_all[ik][:, filt_pos]
+            fractions_ex = fractions_ex_all[ik][filt_pos]
+            fractions_ph = fractions_ph_all[ik][filt_pos]
             i_sort = bd.argsort(ener1)[0:int(
                 self.numeig // 2 - 1
             )]  # Keep only np.shape(mat)[0]//2-1 eigenvalues, corresponding to positive energies
@@ -342,7 +449,6 @@ class HopfieldPol(object):
         self._eners = bd.array(eners)
         self._eners_im = bd.array(eners_im)
         self._eigvecs = bd.array(self._eigvecs)
-        self.mat = mat
 
         self.total_time = time.time() - t_start
 
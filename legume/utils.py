@@ -8,6 +8,7 @@ from scipy.linalg import toeplitz
 from scipy.optimize import brentq
 import legume.constants as cs
 import warnings
+from bisect import bisect_left
 
 
 def ftinv(ft_coeff, gvec, xgrid, ygrid):
@@ -238,15 +239,8 @@ def z_to_lind(phc, z):
         Get a layer index corresponding to a position z. Claddings are included 
         as first and last layer
         """
-    N_layers = len(phc.layers)
-    z_max = phc.claddings[0].z_max
-    lind = 0  # Index denoting which layer (including claddings) z is in
-    while z > z_max and lind < N_layers:
-        lind += 1
-        z_max = phc.layers[lind - 1].z_max
-    if z > z_max and lind == N_layers: lind += 1
-
-    return lind
+    # Index of the first layer (including claddings) whose z_max is >= z
+    return bisect_left(phc.layers_z_max, get_value(z))
 
 
 def from_freq_to_e(a):
@@ -0,0 +1,35 @@
+import unittest
+
+import numpy as np
+
+import legume
+
+
+class TestLattice(unittest.TestCase):
+    '''
+    Tests of the Lattice construction
+    '''
+    def test_custom(self):
+        # Integer primitive vectors give float lattice vectors
+        lattice = legume.Lattice([1, 0], [0, 2])
+        self.assertEqual(lattice.type, 'rectangular')
+        self.assertEqual(lattice.a1.dtype, np.float64)
+        self.assertEqual(lattice.a2.dtype, np.float64)
+        self.assertTrue(np.allclose(lattice.a1, [1, 0]))
+        self.assertTrue(np.allclose(lattice.a2, [0, 2]))
+
+        lattice = legume.Lattice([1, 0], [0.5, np.sqrt(3) / 2])
+        self.assertEqual(lattice.type, 'custom')
+
+        # Primitive vectors must have exactly two components
+        self.assertRaises(ValueError, legume.Lattice, *([1, 0, 0], [0, 1]))
+        self.assertRaises(ValueError, legume.Lattice, *([1, 0], [1]))
+
+    def test_hexagonal(self):
+        lattice = legume.Lattice('hexagonal')
+        self.assertTrue(np.allclose(lattice.a1, [0.5, np.sqrt(3) / 2]))
+        self.assertTrue(np.allclose(lattice.a2, [0.5, -np.sqrt(3) / 2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
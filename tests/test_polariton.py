@@ -10,7 +10,7 @@ class TestHOP(unittest.TestCase):
     quantum wells. It is compared with legume 
     data.
     '''
-    def test_pol(self):
+    def run_pol(self, **run_options):
 
         g_max = 4.1
         # ------------- structure 
@@ -63,8 +63,54 @@ class TestHOP(unittest.TestCase):
         exc_options = {'numeig_ex':8,
                 'verbose_ex':False}
                 
-        pol.run(kpoints=path['kpoints'],gme_options=gme_options,exc_options=exc_options,verbose=False)
-        
+        pol.run(kpoints=path['kpoints'],gme_options=gme_options,exc_options=exc_options,verbose=False,**run_options)
+
+        return pol
+
+    def run_pol_multi_qw(self, **run_options):
+        '''
+        Three quantum wells, two of which sit at the same z
+        and share the photonic field components.
+        '''
+        # ------------- structure 
+        a = 2.45*10**-7
+        dqw = 2*1e-8/a
+        M = cs.m_e*0.18
+        osc_str = 10*10**16*np.array([1,1,0])
+        loss = 10*1e-6
+        # ------------- structure 
+
+        lattice = legume.Lattice("square")
+
+        path = lattice.bz_path([[0.05*np.pi,0.05*np.pi], "g",[0.05*np.pi,0]],[4])
+
+        phc = legume.PhotCryst(lattice,eps_l=1.45**2)
+        phc.add_layer(d=0.3, eps_b=3.56**2)
+        phc.add_layer(d=dqw, eps_b=3.32**2)
+        phc.add_layer(d=dqw, eps_b=3.56**2)
+        phc.add_layer(d=0.3, eps_b=3.56**2)
+        phc.add_shape(legume.Circle(r=0.26, eps=1, x_cent=0., y_cent=0.))
+
+        phc.add_qw(z=phc.layers[1].z_mid,a=a,M=M,E0=1.53,V_shapes=1,loss=loss,osc_str=osc_str)
+        phc.add_qw(z=phc.layers[2].z_mid,a=a,M=M,E0=1.53,V_shapes=1,loss=loss,osc_str=osc_str)
+        phc.add_qw(z=phc.layers[2].z_mid,a=a,M=M,E0=1.55,V_shapes=1,loss=loss,osc_str=osc_str)
+
+        pol = legume.HopfieldPol(phc,3.1,truncate_g='abs')
+        gme_options = {'gmode_inds':[0,1,2,3],
+                        'numeig':6,
+                        'verbose':False}
+
+        exc_options = {'numeig_ex':5,
+                'verbose_ex':False}
+
+        pol.run(kpoints=path['kpoints'],gme_options=gme_options,exc_options=exc_options,verbose=False,**run_options)
+
+        return pol
+
+    def test_pol(self):
+
+        pol = self.run_pol()
+
         en = np.load('./tests/data/Polariton_en.npy')
         im = np.load('./tests/data/Polariton_im.npy')
         fr = np.load('./tests/data/Polariton_fr.npy')
@@ -77,6 +123,79 @@ class TestHOP(unittest.TestCase):
         self.assertLessEqual(diff_im, 1e-8)
         self.assertLessEqual(diff_fr, 1e-8)
 
+    def test_pol_n_jobs(self):
+        '''
+        k-points solved on two threads compared with 
+        legume data.
+        '''
+        pol = self.run_pol(n_jobs=2)
+
+        en = np.load('./tests/data/Polariton_en.npy')
+        im = np.load('./tests/data/Polariton_im.npy')
+        fr = np.load('./tests/data/Polariton_fr.npy')
+
+        diff_E = np.sum(np.abs(pol.eners-en))
+        diff_im = np.sum(np.abs(pol.eners_im-im))
+        diff_fr = np.sum(np.abs(pol.fractions_ex-fr))
+
+        self.assertLessEqual(diff_E, 1e-8)
+        self.assertLessEqual(diff_im, 1e-8)
+        self.assertLessEqual(diff_fr, 1e-8)
+
+    def test_pol_multi_qw(self):
+        '''
+        Multiple quantum wells compared with legume data.
+        '''
+        pol = self.run_pol_multi_qw()
+
+        en = np.load('./tests/data/Polariton_multi_qw_en.npy')
+        im = np.load('./tests/data/Polariton_multi_qw_im.npy')
+        fr = np.load('./tests/data/Polariton_multi_qw_fr.npy')
+
+        diff_E = np.sum(np.abs(pol.eners-en))
+        diff_im = np.sum(np.abs(pol.eners_im-im))
+        diff_fr = np.sum(np.abs(pol.fractions_ex-fr))
+
+        self.assertLessEqual(diff_E, 1e-8)
+        self.assertLessEqual(diff_im, 1e-8)
+        self.assertLessEqual(diff_fr, 1e-8)
+
+    def test_pol_complex64(self):
+        '''
+        Single-precision Hopfield matrix compared with 
+        the double-precision legume data.
+        '''
+        pol = self.run_pol(dtype=np.complex64)
+
+        en = np.load('./tests/data/Polariton_en.npy')
+        fr = np.load('./tests/data/Polariton_fr.npy')
+
+        self.assertEqual(pol.mat.dtype, np.complex64)
+        self.assertLessEqual(np.max(np.abs(pol.eners-en)), 1e-4)
+        self.assertLessEqual(np.max(np.abs(pol.fractions_ex-fr)), 1e-3)
+
+    def test_pol_multi_qw_complex64(self):
+        '''
+        Multiple quantum wells with a single-precision 
+        Hopfield matrix compared with the double-precision 
+        legume data.
+        '''
+        pol = self.run_pol_multi_qw(dtype=np.complex64)
+        pol_ref = self.run_pol_multi_qw()
+
+        en = np.load('./tests/data/Polariton_multi_qw_en.npy')
+        fr = np.load('./tests/data/Polariton_multi_qw_fr.npy')
+
+        # The matrix itself must agree to single precision
+        self.assertEqual(pol.mat.dtype, np.complex64)
+        diff_mat = np.max(np.abs(pol.mat-pol_ref.mat))/np.max(np.abs(pol_ref.mat))
+        self.assertLessEqual(diff_mat, 1e-6)
+
+        # Excitonic levels ~1e-7 eV apart mix in single precision,
+        # so the fractions are only compared loosely
+        self.assertLessEqual(np.max(np.abs(pol.eners-en)), 1e-4)
+        self.assertLessEqual(np.max(np.abs(pol.fractions_ex-fr)), 1e-2)
+
 
 if __name__ == '__main__':
     unittest.main()